@@ -1,4 +1,5 @@
 import os
+import httpx
 from dotenv import load_dotenv
 from functools import lru_cache
 from openai import OpenAI
@@ -13,6 +14,10 @@ DOTENV_PATH = os.path.join(os.path.dirname(__file__), ".env")  # Ensure correct
 load_dotenv(DOTENV_PATH)
 
 
+# Maximum number of pooled connections to the OpenAI API (matches the concurrent validation requests)
+OPENAI_MAX_CONNECTIONS = 10
+
+
 # Lazy-load OpenAI client
 @lru_cache()
 def get_openai_client():
@@ -24,7 +29,13 @@ def get_openai_client():
     if not OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY is not set. Check your .env file.")
 
-    return OpenAI(api_key=OPENAI_API_KEY)
+    # Share one pooled HTTP/2 client so concurrent requests are multiplexed over open keep-alive connections
+    http_client = httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS)
+    )
+    return OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
 
 
 # Lazy-load SBERT model
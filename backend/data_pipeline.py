@@ -4,17 +4,17 @@ import sqlite3
 import os
 import csv
 import json
+import orjson
 from pathlib import Path
 from typing import Dict, Any, List
 import time
 import traceback
-from collections import defaultdict
 import asyncio
-from asyncio import Lock
+from asyncio import Lock, Semaphore
 
 from text_processing.extraction import extract_text_from_file_using_opencv, extract_text_from_file_using_azure
-from text_processing.formatting import generate_data_dict_using_openai, deduplicate_courses, preprocess_data_dict, json_data_to_dataframe
-from text_processing.validation import rule_based_validation, validate_coursework_openai, openai_based_validation
+from text_processing.formatting import generate_data_dict_using_openai, deduplicate_courses, preprocess_data_dict
+from text_processing.validation import rule_based_validation, openai_based_validation
 from text_processing.matching import match_courses_using_openai, match_courses_using_sbert
 from db_service import insert_records_from_dict
 from utils import (
@@ -27,8 +27,34 @@ from utils import (
 OUTPUT_FOLDER = "./middle_products"
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Print the intermediate data dicts while processing (off by default, set DEBUG_OUTPUT=true in .env to enable)
+DEBUG_OUTPUT = os.getenv("DEBUG_OUTPUT", "false").strip().lower() == "true"
 
-global_lock = Lock()  # Global lock to synchronize file processing
+# Column types for transcript CSVs (skips type inference; grades and dates stay text as written, numeric
+# columns are read as text too and converted afterwards so values like "P/F" do not fail the whole file)
+CSV_COLUMN_DTYPES = {
+    "file_name": str, "first_name": str, "middle_name": str, "last_name": str,
+    "institution_name": str, "degree": str, "major": str, "minor": str, "awarded_date": str,
+    "overall_credits_earned": str, "overall_gpa": str,
+    "course_name": str, "credits_earned": str, "grade": str
+}
+
+
+MAX_CONCURRENT_FILES = 4  # Maximum number of files processed at the same time
+processing_semaphore = Semaphore(MAX_CONCURRENT_FILES)  # Bounds concurrent file processing
+database_lock = Lock()  # Serializes database writes (educator lookup + insert must not interleave)
+
+
+# Print an intermediate data dict when debug output is enabled
+def print_debug_data(label, data):
+    """
+    Prints a data dict as indented JSON, only if DEBUG_OUTPUT is enabled (skips the encoding otherwise).
+    Args:
+        label (str): Text printed before the data.
+        data (dict): Data to print.
+    """
+    if DEBUG_OUTPUT:
+        print(label, orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str).decode())
 
 
 # Step 1 option 1: Load data from csv file 
@@ -43,7 +69,7 @@ def load_data(file_path: str) -> dict:
     try:
         # Load CSV into a DataFrame
         print("Loading data from CSV...")
-        df = pd.read_csv(file_path)
+        df = pd.read_csv(file_path, dtype=CSV_COLUMN_DTYPES)
         if df.empty:
             return {
                 "status": "error",
@@ -52,66 +78,53 @@ def load_data(file_path: str) -> dict:
                 "file": file_path
             }
 
-        # Initialize the data dictionary
-        data_dict = {"student": {}, "degrees": [], "file_name": df["file_name"].iloc[0] if "file_name" in df else ""}
+        # Initialize the data dictionary (the file name comes from the uploaded file itself)
+        data_dict = {"student": {}, "degrees": [], "file_name": os.path.basename(file_path)}
 
         # Extract student details
+        middle_name = df["middle_name"].iat[0] if "middle_name" in df else None
         data_dict["student"] = {
-            "first_name": df["first_name"].iloc[0] if "first_name" in df else "",
-            "middle_name": df["middle_name"].iloc[0] if "middle_name" in df and pd.notna(df["middle_name"].iloc[0]) else "",
-            "last_name": df["last_name"].iloc[0] if "last_name" in df else "",
+            "first_name": df["first_name"].iat[0] if "first_name" in df else "",
+            "middle_name": middle_name if pd.notna(middle_name) else "",
+            "last_name": df["last_name"].iat[0] if "last_name" in df else "",
         }
 
-        # Group courses by unique degree
-        degrees = defaultdict(lambda: {
-            "degree": "",
-            "major": "",
-            "minor": "",
-            "institution_name": "",
-            "awarded_date": "",
-            "overall_credits_earned": None,
-            "overall_gpa": None,
-            "courses": []
-        })
+        # Normalize text columns once (missing columns or values become "", surrounding whitespace is stripped)
+        for column in ["institution_name", "degree", "major", "minor", "awarded_date", "course_name", "grade"]:
+            df[column] = df[column].fillna("").astype(str).str.strip() if column in df else ""
 
+        # Normalize numeric columns once (missing columns or non-numeric values become None)
+        for column in ["overall_credits_earned", "overall_gpa", "credits_earned"]:
+            if column in df:
+                numeric_values = pd.to_numeric(df[column], errors="coerce")
+                df[column] = numeric_values.astype(object).where(numeric_values.notna(), None)
+            else:
+                df[column] = None
+
+        # Group courses by unique degree, using a standardized key to prevent minor differences causing duplicate degrees
         print("Organizing courses by degree...")
-        for _, row in df.iterrows():
-            # Normalize key values to prevent minor differences causing duplicate degrees
-            institution = row["institution_name"].strip() if "institution_name" in row and pd.notna(row["institution_name"]) else ""
-            degree = row["degree"].strip() if "degree" in row and pd.notna(row["degree"]) else ""
-            major = row["major"].strip() if "major" in row and pd.notna(row["major"]) else ""
-            minor = row["minor"].strip() if "minor" in row and pd.notna(row["minor"]) else ""
-            awarded_date = row["awarded_date"].strip() if "awarded_date" in row and pd.notna(row["awarded_date"]) else ""
-
-            # Create a standardized key for degree grouping
-            degree_key = (institution.lower(), degree.lower(), major.lower(), minor.lower(), awarded_date)
-
-            # Populate degree details only once
-            if not degrees[degree_key]["degree"]: 
-                degrees[degree_key].update({
-                    "degree": degree,
-                    "major": major,
-                    "minor": minor,
-                    "institution_name": institution,
-                    "awarded_date": awarded_date,
-                    "overall_credits_earned": row["overall_credits_earned"] if "overall_credits_earned" in row and pd.notna(row["overall_credits_earned"]) else None,
-                    "overall_gpa": row["overall_gpa"] if "overall_gpa" in row and pd.notna(row["overall_gpa"]) else None,
-                })
-
-            # Add course information under the respective degree
-            degrees[degree_key]["courses"].append({
-                "course_name": row["course_name"].strip() if "course_name" in row and pd.notna(row["course_name"]) else "",
-                "credits_earned": row["credits_earned"] if "credits_earned" in row and pd.notna(row["credits_earned"]) else None,
-                "grade": row["grade"].strip() if "grade" in row and pd.notna(row["grade"]) else "",
+        degree_key = [
+            df["institution_name"].str.lower(), df["degree"].str.lower(), df["major"].str.lower(), 
+            df["minor"].str.lower(), df["awarded_date"]
+        ]
+        for _, group in df.groupby(degree_key, sort=False, dropna=False):
+            # Take the degree details from the first row of the group
+            first_row = group.iloc[0]
+            data_dict["degrees"].append({
+                "degree": first_row["degree"],
+                "major": first_row["major"],
+                "minor": first_row["minor"],
+                "institution_name": first_row["institution_name"],
+                "awarded_date": first_row["awarded_date"],
+                "overall_credits_earned": first_row["overall_credits_earned"],
+                "overall_gpa": first_row["overall_gpa"],
+                "courses": [
+                    {"course_name": course_name, "credits_earned": credits_earned, "grade": grade}
+                    for course_name, credits_earned, grade in zip(group["course_name"], group["credits_earned"], group["grade"])
+                ]
             })
 
-        # Convert defaultdict to list of degrees
-        data_dict["degrees"] = list(degrees.values())
-
-        # Add the file name to the DataFrame
-        data_dict["file_name"] = os.path.basename(file_path)
-
-        print("Loaded data:", json.dumps(data_dict, indent=4))
+        print_debug_data("Loaded data:", data_dict)
 
         print("Data loaded successfully.")
         return {
@@ -144,7 +157,7 @@ def extract_data(file_path: str) -> dict:
     """
     try:
         # Extract text from PDF
-        extracted_text = extract_text_from_file_using_opencv(file_path, OUTPUT_FOLDER)
+        extracted_text = extract_text_from_file_using_opencv(file_path)
         if not extracted_text:
             return {
                 "status": "error",
@@ -167,15 +180,15 @@ def extract_data(file_path: str) -> dict:
         if not data_dict:
             return {
                 "status": "error",
-                "message": "OpenAI response is empty. Check API request and input text.",
-                "details": "Possible issues: API timeout, invalid input text, or authentication failure.",
+                "message": "OpenAI extraction failed. Check API request and input text.",
+                "details": "Possible issues: API timeout, invalid input text, authentication failure, or a response truncated at the output token limit.",
                 "file": file_path
             }
 
         # Add the file name to the dictionary
         data_dict["file_name"] = os.path.basename(file_path)
 
-        print("Extracted data:", json.dumps(data_dict, indent=4))
+        print_debug_data("Extracted data:", data_dict)
 
         # Save the JSON obejct to a file
         json_path = os.path.join(OUTPUT_FOLDER, f"{Path(file_path).stem}_extracted_data_dict.json")
@@ -241,7 +254,7 @@ def validate_data(data_dict: dict) -> dict:
                 "details": "Check for issues in OpenAI validation output."
             }
 
-        print("Validated data:", json.dumps(corrected_dict, indent=4))
+        print_debug_data("Validated data:", corrected_dict)
 
         # Save the JSON obejct to a file
         json_path = os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(corrected_dict["file_name"])[0]}_validated_data_dict.json")
@@ -266,7 +279,7 @@ def validate_data(data_dict: dict) -> dict:
 
 
 # Step 3: Structure validated data
-async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
+async def structure_data(data_dict: dict, session) -> dict:
     """
     Reads the extracted transcript data, 
         matches course names to predefined categories using OpenAI, 
@@ -274,6 +287,7 @@ async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
         and handles flagged courses.
     Args:
         data_dict (dict): The raw extracted transcript data.
+        session (FileSession): The file's session, used to share flagged courses and wait for user decisions.
     Returns:
         dict: A dictionary with status, message, and structured data.
     """    
@@ -283,18 +297,46 @@ async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
     # Initialize the list for flagged courses
     flagged_courses_list = []
 
-    # Iterate through each degree and process its courses, check whether user decisions are needed
+    # Perform text matching using OpenAI for the courses of all degrees in a single request
+    print("Matching courses using OpenAI...")
+    all_course_names = [course["course_name"] for degree in data_dict.get("degrees", []) for course in degree["courses"]]
+    all_categorized_courses = match_courses_using_openai(all_course_names, categories_dict) if all_course_names else []
+    course_offset = 0  # Position of the current degree's courses in all_categorized_courses
+
+    # Assign degree levels
     for degree in data_dict.get("degrees", []):
-        # Assign degree level
         degree["degree_level"] = categorize_degree(degree.get("degree", ""))
 
+    # Determine is_passed for the courses of all degrees at once: numeric grades first, then letter grades,
+    # otherwise (empty or unrecognized grade) "Unknown"; each course uses its degree level's passing grade
+    all_courses = [course for degree in data_dict.get("degrees", []) for course in degree["courses"]]
+    passing_grades = [
+        PASSING_GRADES.get(degree["degree_level"], PASSING_GRADES["Bachelor"])  # Default to Bachelor
+        for degree in data_dict.get("degrees", []) for _ in degree["courses"]
+    ]
+    grades = pd.Series([course.get("grade", "").strip() for course in all_courses], dtype=object)
+    numeric_grades = pd.to_numeric(grades, errors="coerce").to_numpy(dtype=float)
+    letter_ranks = grades.str.upper().map(GRADE_RANKING).to_numpy(dtype=float)
+    is_passed = np.select(
+        [~np.isnan(numeric_grades), ~np.isnan(letter_ranks)],
+        [
+            (numeric_grades >= np.array([grade["numeric"] for grade in passing_grades], dtype=float)).astype(object),
+            (letter_ranks >= np.array([GRADE_RANKING[grade["letter"]] for grade in passing_grades], dtype=float)).astype(object)
+        ],
+        default="Unknown"
+    )
+    for course, course_is_passed in zip(all_courses, is_passed.tolist()):
+        course["is_passed"] = course_is_passed
+
+    # Iterate through each degree and process its courses, check whether user decisions are needed
+    for degree in data_dict.get("degrees", []):
         # Initialize flag for uncategorized course
         course_uncategorized_flag = False
         course_names = [course["course_name"] for course in degree["courses"]]
 
-        # Perform text matching using OpenAI
-        print("Matching courses using OpenAI...")
-        categorized_courses = match_courses_using_openai(course_names, categories_dict)
+        # Take this degree's OpenAI matches
+        categorized_courses = all_categorized_courses[course_offset:course_offset + len(course_names)]
+        course_offset += len(course_names)
 
         # If OpenAI fails, fallback to SBERT
         if not categorized_courses or all(category == "Uncategorized" for category in categorized_courses):
@@ -331,24 +373,6 @@ async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
         else:
             credit_mismatch_flag = True
 
-        passing_grade = PASSING_GRADES.get(degree["degree_level"], PASSING_GRADES["Bachelor"])  # Default to Bachelor
-           
-        # Determine is_passed
-        for course in degree["courses"]:
-            grade = course.get("grade", "").strip()
-            if not grade: 
-                course["is_passed"] = "Unknown"
-            else:
-                try: # Determine if grade is numeric
-                    numeric_grade = float(grade)
-                    course["is_passed"] = numeric_grade >= passing_grade["numeric"]
-                except ValueError: # Grade is not a number, check letter grade
-                    letter_grade = grade.upper()
-                    if letter_grade in GRADE_RANKING:
-                        course["is_passed"] = GRADE_RANKING[letter_grade] >= GRADE_RANKING[passing_grade["letter"]]
-                    else:
-                        course["is_passed"] = "Unknown"
-
         # Construct the flagged courses nested dictionary
         flagged_courses = []
         for course in degree["courses"]:
@@ -389,18 +413,19 @@ async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
         print(flagged_courses_list)
         print(f"⚠️ User input required: Pausing processing for {file_name}. Waiting for user decisions...")
 
-        # Store flagged courses and create lock for processing
-        from main import flagged_courses_store, user_decisions_store, notify_status
-        flagged_courses_store[file_name] = flagged_courses_list
+        # Store flagged courses in the file's session
+        from main import notify_status
+        session.flagged_courses = flagged_courses_list
+        session.flagged_courses_ready.set()  # Wake up waiting requests
 
         # Notify frontend via WebSocket
         asyncio.create_task(notify_status(file_name, "ready"))
 
         # wait until frontend submits decisions
-        await processing_lock[file_name].wait() 
+        await session.processing_lock.wait() 
 
         # Apply user decisions
-        user_decisions = user_decisions_store.get(file_name, [])
+        user_decisions = session.user_decisions
         if user_decisions:
             # Map decisions for quick lookup
             decision_map = {
@@ -455,7 +480,7 @@ async def structure_data(data_dict: dict, processing_lock: dict) -> dict:
                 course.get("grade")
             )
 
-    print("Structured data:", json.dumps(data_dict, indent=4))
+    print_debug_data("Structured data:", data_dict)
 
     # Save the JSON obejct to a file
     json_path = os.path.join(OUTPUT_FOLDER, f"{os.path.splitext(data_dict["file_name"])[0]}_structured_data_dict.json")
@@ -481,8 +506,10 @@ def save_to_database(data_dict: dict, database_file: str) -> dict:
     Returns:
         dict: Summary with counts of inserted and duplicate rows.
     """
+    conn = None
     try:
         conn = sqlite3.connect(database_file)
+        conn.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;")  # One cheap fsync per commit
         
         # Insert records using optimized function
         transcript_map = {}  # Caches transcript_id to reduce redundant queries
@@ -499,7 +526,9 @@ def save_to_database(data_dict: dict, database_file: str) -> dict:
         }
 
     except Exception as e:
-        conn.rollback()  # Rollback any changes in case of an error
+        if conn:
+            conn.rollback()  # Rollback any changes in case of an error
+            conn.close()
         print(f"Error saving data: {str(e)}")
         return {
             "status": "error",
@@ -522,13 +551,8 @@ async def process_file(file_path: str, database_file: str) -> dict:
     Returns:
         dict: A response containing the status, message, and any error details.
     """
-    async with global_lock:
-        # Create processing_lock for the file
-        from main import flagged_courses_store, user_decisions_store, processing_lock
-        file_name = os.path.basename(file_path)
-        processing_lock[file_name] = asyncio.Event()
-        
-        # Determine the file type
+    async with processing_semaphore:
+        # Determine the file type (before creating the session state, so an early return can't leave it behind)
         file_extension = os.path.splitext(file_path)[-1].lower()
         if file_extension not in ALLOWED_EXTENSIONS:
             return {
@@ -538,6 +562,13 @@ async def process_file(file_path: str, database_file: str) -> dict:
                 "file": file_path
             }
 
+        # Create processing_lock for the file
+        from main import get_file_session, release_file_session
+        file_name = os.path.basename(file_path)
+        session = get_file_session(file_name)
+        session.processing_lock = asyncio.Event()
+        session.processing_ready.set()  # Wake up the waiting WebSocket
+
         extracted_dict = None # Initialize extracted data dictionary
 
         try:
@@ -575,7 +606,7 @@ async def process_file(file_path: str, database_file: str) -> dict:
 
             # Structure the data
             print("🔧 Structuring validated data...")
-            structured_result = await structure_data(validated_dict, processing_lock)
+            structured_result = await structure_data(validated_dict, session)
             if structured_result["status"] == "error":
                 return structured_result
 
@@ -590,7 +621,8 @@ async def process_file(file_path: str, database_file: str) -> dict:
 
             # Save the data to the database
             print("💾 Saving structured data to the database...")
-            saved_result = await asyncio.to_thread(save_to_database, structured_dict, database_file)
+            async with database_lock:
+                saved_result = await asyncio.to_thread(save_to_database, structured_dict, database_file)
             if saved_result["status"] == "error":
                 return saved_result
 
@@ -622,9 +654,9 @@ async def process_file(file_path: str, database_file: str) -> dict:
 
         finally:
             # Clean up state after processing is complete
-            if file_name in processing_lock:
-                del processing_lock[file_name]
-            if file_name in flagged_courses_store:
-                del flagged_courses_store[file_name]
-            if file_name in user_decisions_store: 
-                del user_decisions_store[file_name]
\ No newline at end of file
+            session.processing_lock = None
+            session.processing_ready.clear()
+            session.flagged_courses = []
+            session.flagged_courses_ready.clear()
+            session.user_decisions = []
+            release_file_session(file_name)
\ No newline at end of file
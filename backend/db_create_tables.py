@@ -51,7 +51,8 @@ CREATE TABLE IF NOT EXISTS courses (
 '''
 
 
-# Index creation statements
+# Index creation statements (the COLLATE NOCASE indexes serve the case-insensitive name and category
+# lookups in query_transcripts; they are created on existing databases too, see check_database_status)
 CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_educators_first_name ON educators (first_name);",
     "CREATE INDEX IF NOT EXISTS idx_educators_last_name ON educators (last_name);",
@@ -60,6 +61,8 @@ CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_courses_transcript_id ON courses (transcript_id);",
     "CREATE INDEX IF NOT EXISTS idx_courses_course_name ON courses (course_name);",
     "CREATE INDEX IF NOT EXISTS idx_courses_category ON courses (should_be_category);",
+    "CREATE INDEX IF NOT EXISTS idx_educators_name_nocase ON educators (first_name COLLATE NOCASE, last_name COLLATE NOCASE);",
+    "CREATE INDEX IF NOT EXISTS idx_courses_category_nocase ON courses (should_be_category COLLATE NOCASE);",
 ]
 
 def initialize_database(database_file):
@@ -7,6 +7,7 @@ import pandas as pd
 import sqlite3
 from sqlite3 import Connection
 import traceback
+from functools import lru_cache
 from db_create_tables import initialize_database
 
 
@@ -40,12 +41,22 @@ def check_database_content(database_file: str):
 def check_database_status(database_file: str):
     if not database_file or not os.path.exists(database_file):
         print(f"❌ Database file not found: {database_file}. Creating a new one...")
-        initialize_database(database_file)
+
+    # Create any missing tables and indexes (an existing database also gets indexes added since it was created)
+    initialize_database(database_file)
     
     # Verify database content
     check_database_content(database_file)
 
 
+# Function to convert is_passed to its SQLite value
+def is_passed_to_db_value(is_passed):
+    """
+    Converts is_passed to an integer for SQLite (1 = True, 0 = False, NULL if not a boolean, e.g. None or "Unknown").
+    """
+    return int(is_passed) if isinstance(is_passed, bool) else None
+
+
 # Function to insert an educator
 def insert_educator(
     conn: Connection, 
@@ -54,7 +65,7 @@ def insert_educator(
     middle_name: str = None
 ) -> int:
     """
-    Inserts a new educator into the educators table.
+    Inserts a new educator into the educators table. The caller commits the transaction.
     Args:
         conn (Connection): Database connection object.
         first_name (str): The first name of the educator.
@@ -69,7 +80,6 @@ def insert_educator(
            VALUES (?, ?, ?)''', 
         (first_name, last_name, middle_name)
     )
-    conn.commit()
 
     # Return the last inserted ID (educator_id)
     return cursor.lastrowid
@@ -90,7 +100,7 @@ def insert_transcript(
     overall_gpa: float = None, 
 ) -> int:
     """
-    Inserts a new transcript into the transcripts table.
+    Inserts a new transcript into the transcripts table. The caller commits the transaction.
     Args:
         conn (Connection): Database connection object.
         educator_id (int): ID of the educator (foreign key).
@@ -115,7 +125,6 @@ def insert_transcript(
         (educator_id, institution_name, degree_level, file_name, degree, 
          major, minor, awarded_date, overall_credits_earned, overall_gpa)
     )
-    conn.commit()
 
     # Return the last inserted ID (transcript_id)
     return cursor.lastrowid
@@ -134,7 +143,7 @@ def insert_or_update_course(
     is_passed: bool = None,
 ) -> int:
     """
-    Inserts a new course or updates an existing one if a course with the same row_hash exists.
+    Inserts a new course or updates an existing one if a course with the same row_hash exists. The caller commits the transaction.
     Args:
         conn (Connection): Database connection object.
         transcript_id (int): The ID of the transcript (foreign key).
@@ -150,8 +159,8 @@ def insert_or_update_course(
     """
     cursor = conn.cursor()
 
-    # Convert `is_passed` to an integer for SQLite (1 = True, 0 = False, NULL if None)
-    is_passed_value = None if is_passed is None else int(is_passed)
+    # Convert `is_passed` to an integer for SQLite (1 = True, 0 = False, NULL otherwise)
+    is_passed_value = is_passed_to_db_value(is_passed)
 
     # Check if a course with the same hash already exists
     cursor.execute("""
@@ -174,7 +183,6 @@ def insert_or_update_course(
                 WHERE course_id = ?""",
                 (should_be_category, adjusted_credits_earned, credits_earned, is_passed_value, course_id)
             )
-            conn.commit()
         else:
             print(f"No changes detected for course: {course_name}. Skipping update.")
         
@@ -186,7 +194,6 @@ def insert_or_update_course(
            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
         (transcript_id, course_name, should_be_category, adjusted_credits_earned, row_hash, credits_earned, grade, is_passed_value)
     )
-    conn.commit()
 
     # Return the last inserted ID (course_id)
     return cursor.lastrowid
@@ -202,17 +209,22 @@ def insert_records_from_dict(conn, data_dict: dict, transcript_map: dict) -> dic
         transcript_map (dict): Cached mapping of file names to transcript IDs.
     Returns:
         dict: A summary with counts of inserted and updated rows.
+    Raises:
+        Exception: Re-raised after rolling back the whole file if any insert fails.
     """
     cursor = conn.cursor()
 
-    # Get existing hashes from the database
-    existing_hashes = set(row[0] for row in cursor.execute("SELECT row_hash FROM courses"))
-
     inserted_count = 0
     updated_count = 0
-    batch_size = 10  # Commit after every 10 insertions for performance
+    new_course_rows = []  # New courses, inserted in one batch
 
     try:
+        # Write the whole file in a single transaction (one commit instead of one per row)
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # Get existing hashes from the database
+        existing_hashes = set(row[0] for row in cursor.execute("SELECT row_hash FROM courses"))
+
         # Extract student-level information
         student = data_dict.get("student", {})
         first_name = student.get("first_name", "")
@@ -287,29 +299,36 @@ def insert_records_from_dict(conn, data_dict: dict, transcript_map: dict) -> dic
                         updated_count += 1
                     continue  # Skip inserting new record
 
-                # Insert course record
-                course_id = insert_or_update_course(
-                    conn, transcript_id, 
+                # Queue course record for insertion
+                new_course_rows.append((
+                    transcript_id, 
                     course["course_name"], 
                     course["should_be_category"], 
                     course["adjusted_credits_earned"], 
-                    course["row_hash"], 
+                    row_hash, 
                     course["credits_earned"], 
                     course["grade"],
-                    course["is_passed"]
-                )
-                inserted_count += 1
+                    is_passed_to_db_value(course["is_passed"])
+                ))
+
+        # Insert the new courses in one batch (a repeated row_hash within the file updates the first row)
+        cursor.executemany(
+            '''INSERT INTO courses (transcript_id, course_name, should_be_category, adjusted_credits_earned, row_hash, credits_earned, grade, is_passed)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(row_hash) DO UPDATE SET 
+                   should_be_category = excluded.should_be_category, adjusted_credits_earned = excluded.adjusted_credits_earned, 
+                   credits_earned = excluded.credits_earned, is_passed = excluded.is_passed''',
+            new_course_rows
+        )
+        inserted_count = len(new_course_rows)
 
-                # Commit periodically for performance
-                if (inserted_count + updated_count) % batch_size == 0: 
-                    conn.commit()  
-        
-        conn.commit()  # Final commit for remaining transactions
+        conn.commit()  # Commit the whole file at once
 
     except Exception as e:
         conn.rollback()  # Rollback changes if any error occurs
         print(f"Error inserting records: {str(e)}")
         print(traceback.format_exc())
+        raise  # Nothing from this file was saved, let the caller report the error
 
     return {
         "inserted_count": inserted_count,
@@ -317,15 +336,18 @@ def insert_records_from_dict(conn, data_dict: dict, transcript_map: dict) -> dic
     }
 
 
-# Function to query transcript data based on search criteria
-def query_transcripts(conn: Connection, criteria: dict) -> list:
+# Build the transcript search SQL for a combination of filters (cached, so every search with the same
+# filters reuses one SQL string and hits the connection's prepared statement cache)
+@lru_cache(maxsize=None)
+def build_transcripts_query(filter_by_name: bool, filter_by_category: bool, education_level_count: int) -> str:
     """
-    Query transcript data based on search criteria.
+    Builds the parameterized transcript search query.
     Args:
-        conn (Connection): Database connection object.
-        criteria (dict): Search parameters containing educator_name and/or course_category and/or education_level.
+        filter_by_name (bool): Whether to filter by the educator's first and last name.
+        filter_by_category (bool): Whether to filter by course category.
+        education_level_count (int): Number of education levels to filter by (0 for no filter).
     Returns:
-        list: Queried results.
+        str: The SQL query with ? placeholders.
     """
     query = '''
         SELECT 
@@ -343,31 +365,50 @@ def query_transcripts(conn: Connection, criteria: dict) -> list:
         WHERE 1=1 
     ''' 
 
-    params = []
-
     # Filtering by educator's name
-    if criteria.get("educator_first_name") and criteria.get("educator_last_name"):
-        query += " AND LOWER(educators.first_name) = LOWER(?) AND LOWER(educators.last_name) = LOWER(?)"
-        params.append(criteria["educator_first_name"].lower())
-        params.append(criteria["educator_last_name"].lower())
+    if filter_by_name:
+        query += " AND educators.first_name = ? COLLATE NOCASE AND educators.last_name = ? COLLATE NOCASE"
     
     # Filtering by course category
-    if criteria.get("course_category"):
-        query += " AND LOWER(courses.should_be_category) = LOWER(?)"
-        params.append(criteria["course_category"].lower())
+    if filter_by_category:
+        query += " AND courses.should_be_category = ? COLLATE NOCASE"
 
     # Filtering by education level
-    if criteria.get("education_level") and isinstance(criteria["education_level"], list):
-        placeholders = ", ".join(["?" for _ in criteria["education_level"]])  # Create correct number of placeholders
+    if education_level_count:
+        placeholders = ", ".join(["?"] * education_level_count)  # Create correct number of placeholders
         query += f" AND transcripts.degree_level IN ({placeholders})"
-        params.extend(criteria["education_level"])
+
+    return query
+
+
+# Function to query transcript data based on search criteria
+def query_transcripts(conn: Connection, criteria: dict) -> pd.DataFrame:
+    """
+    Query transcript data based on search criteria.
+    Args:
+        conn (Connection): Database connection object.
+        criteria (dict): Search parameters containing educator_name and/or course_category and/or education_level.
+    Returns:
+        pd.DataFrame: Queried results, read directly into a DataFrame without building per-row tuples.
+    """
+    filter_by_name = bool(criteria.get("educator_first_name") and criteria.get("educator_last_name"))
+    filter_by_category = bool(criteria.get("course_category"))
+    education_levels = criteria["education_level"] if isinstance(criteria.get("education_level"), list) else []
+
+    query = build_transcripts_query(filter_by_name, filter_by_category, len(education_levels))
+
+    params = []
+    if filter_by_name:
+        params.append(criteria["educator_first_name"])
+        params.append(criteria["educator_last_name"])
+    if filter_by_category:
+        params.append(criteria["course_category"])
+    params.extend(education_levels)
 
     try:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        results = cursor.fetchall()
+        results = pd.read_sql_query(query, conn, params=params)
 
-        return None if not results else results
+        return None if results.empty else results
     except Exception as e:
         print(f"❌ Database Query Failed: {str(e)}")
         return "error" 
@@ -3,18 +3,24 @@
 # Define routes for uploading, searching, and downloading data
 ##
 
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import sqlite3
 import os
+import shutil
 from dotenv import load_dotenv
 import json
-import pandas as pd
+import orjson
 import traceback
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 import base64
+import hashlib
 import asyncio
+import queue
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+from dataclasses import dataclass, field
 
 from data_pipeline import process_file
 from db_service import check_database_status, query_transcripts
@@ -24,7 +30,14 @@ from utils import (
 )
 
 
-app = FastAPI()
+# Check (or create) the database once when the app starts, instead of on every upload
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(check_database_status, DATABASE_FILE)
+    yield
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Allow CORS for all origins (for development purposes)
 app.add_middleware(
@@ -45,29 +58,101 @@ DATABASE_FILE = os.getenv("DATABASE_FILE", "../database/database.db") # Load Dat
 
 UPLOAD_FOLDER = './uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB buffer when copying uploads to disk
 
+DB_POOL_SIZE = 4  # Maximum number of idle database connections kept for reuse
+db_connection_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=DB_POOL_SIZE)
 
-# Get database connection
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_FILE)#, check_same_thread=False)  # Allow cross-thread access
+
+# Open a new database connection
+def open_db_connection():
+    conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL lets searches read while uploads write; larger page cache and mmap keep hot pages in memory
+    conn.executescript("""
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=268435456;
+        PRAGMA temp_store=MEMORY;
+    """)
     return conn
 
 
-# Global storage for WebSocket connections & flagged courses
-websocket_connections: Dict[str, WebSocket] = {}
-flagged_courses_store: Dict[str, List[Dict]] = {}
-user_decisions_store: Dict[str, List[Dict]] = {}
-processing_lock: Dict[str, asyncio.Event] = {} # Lock to pause/resume processing
-websocket_closed_flags: Dict[str, bool] = {}  # Track whether WebSocket has been closed
+# Borrow a database connection from the pool (opening one if none is idle) and return it when done
+@contextmanager
+def get_db_connection():
+    try:
+        conn = db_connection_pool.get_nowait()
+    except queue.Empty:
+        conn = open_db_connection()
+
+    try:
+        yield conn
+    finally:
+        try:
+            db_connection_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+# Per-file state shared by the pipeline, the WebSocket and the flagged course endpoints
+@dataclass
+class FileSession:
+    websocket: Optional[WebSocket] = None
+    websocket_closed: bool = False  # Track whether WebSocket has been closed
+    flagged_courses: List[Dict] = field(default_factory=list)
+    flagged_courses_ready: asyncio.Event = field(default_factory=asyncio.Event)  # Set once flagged courses are stored
+    user_decisions: List[Dict] = field(default_factory=list)
+    processing_lock: Optional[asyncio.Event] = None  # Lock to pause/resume processing; None when not processing
+    processing_ready: asyncio.Event = field(default_factory=asyncio.Event)  # Set once processing_lock is created
+
+
+# Global storage for file sessions
+file_sessions: Dict[str, FileSession] = {}
+
+
+# Names of the files currently being uploaded or processed (a file name is processed by one upload at a time)
+files_in_progress: Set[str] = set()
+
+
+# Get (or create) the session for a file
+def get_file_session(file_name: str) -> FileSession:
+    session = file_sessions.get(file_name)
+    if session is None:
+        session = file_sessions[file_name] = FileSession()
+    return session
+
+
+# Drop a file's session once it is neither processing nor connected
+def release_file_session(file_name: str):
+    session = file_sessions.get(file_name)
+    if session and session.processing_lock is None and session.websocket is None:
+        file_sessions.pop(file_name, None)
 
 
 # Return a list of course categories
+COURSE_CATEGORIES_CACHE_CONTROL = "public, max-age=3600"
+
+
+# Serialize the course categories response once, with its ETag (the categories don't change while the app is running)
+@lru_cache(maxsize=1)
+def get_course_categories_body():
+    categories_list = list(load_course_categories().keys())
+    body = orjson.dumps({"course_categories": categories_list})
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+
 @app.get("/course-categories")
-def get_course_categories():
-    categories_dict = load_course_categories()
-    categories_list = list(categories_dict.keys())
-    return {"course_categories": categories_list}
+def get_course_categories(request: Request):
+    body, etag = get_course_categories_body()
+    headers = {"ETag": etag, "Cache-Control": COURSE_CATEGORIES_CACHE_CONTROL}
+
+    # The client already has the current list
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # Send WebSocket notifications to frontend with stauts
@@ -78,7 +163,8 @@ async def notify_status(file_name: str, status: str):
     """
     print(f"🔍 Debug: Attempting to send WebSocket message for {file_name}: {status}")
 
-    ws = websocket_connections.get(file_name) # Get the WebSocket for this file
+    session = file_sessions.get(file_name)
+    ws = session.websocket if session else None # Get the WebSocket for this file
     if not ws:
         print(f"No WebSocket connection found for {file_name}.")
         return
@@ -90,20 +176,20 @@ async def notify_status(file_name: str, status: str):
             return
 
         # Send the status message
-        await ws.send_json({"status": status, "file_name": file_name})
+        await ws.send_text(orjson.dumps({"status": status, "file_name": file_name}).decode())
         print(f"🌐 WebSocket notification sent: {status} for {file_name}")
         
         # Close the WebSocket if the status indicates it's no longer needed
         if status in {"no_flagged_courses", "intentional_closure"}:
             await asyncio.sleep(3)  # Give the frontend time to handle closure
             await ws.close()
-            websocket_connections.pop(file_name, None)
-            websocket_closed_flags[file_name] = True
+            session.websocket = None
+            session.websocket_closed = True
             print(f"🌐 WebSocket connection closed for {file_name}")
 
     except Exception as e:
         print(f"🌐 Error sending WebSocket message for {file_name}: {e}")
-        websocket_connections.pop(file_name, None)
+        session.websocket = None
 
 
 # Manage WebSocket connections for flagged courses
@@ -119,32 +205,31 @@ async def websocket_flagged_courses(websocket: WebSocket, file_name: str):
     await websocket.accept()
 
     # Store WebSocket connection
-    websocket_connections[file_name] = websocket
+    session = get_file_session(file_name)
+    session.websocket = websocket
+    session.websocket_closed = False
+
+    # Serialize the connection confirmation once; it is sent as a text frame, which the frontend JSON-parses
+    connected_message = orjson.dumps({"status": "connected", "file_name": file_name}).decode()
 
     try:
         # Send initial connection confirmation
-        await websocket.send_json({"status": "connected", "file_name": file_name})
+        await websocket.send_text(connected_message)
         
         # Wait for processing_lock to be created
-        max_retries = 10 
-        retry_delay = 1  # Delay between retries (in seconds)
-        for attempt in range(max_retries):
-            if file_name in processing_lock:
-                break  
-            await asyncio.sleep(retry_delay)  # Wait before retrying
-
-        if file_name not in processing_lock:
-            print(f"🌐 Processing lock not created for {file_name} after {max_retries} attempts. Closing WebSocket.")
+        wait_timeout = 10  # Maximum time to wait for processing to start (in seconds)
+        try:
+            await asyncio.wait_for(session.processing_ready.wait(), timeout=wait_timeout)
+        except asyncio.TimeoutError:
+            print(f"🌐 Processing lock not created for {file_name} after {wait_timeout}s. Closing WebSocket.")
             await websocket.close()
             return
 
-        # Main WebSocket loop
-        while file_name in processing_lock:
-            try:
-                data = await asyncio.wait_for(websocket.receive_json(), timeout=20)  # Keep WebSocket alive
-                print(f"🌐 WebSocket received message: {data}")
-            except asyncio.TimeoutError:
-                await websocket.send_json({"status": "ping"})  # Keep alive every 20s
+        # Main WebSocket loop: block on the client's keepalive messages; dead peers are detected by
+        # Uvicorn's protocol-level pings (--ws-ping-interval / --ws-ping-timeout), which raise WebSocketDisconnect
+        while session.processing_lock is not None:
+            data = await websocket.receive_json()
+            print(f"🌐 WebSocket received message: {data}")
 
     except WebSocketDisconnect:
         print(f"🌐 WebSocket disconnected unexpectedly for {file_name}")
@@ -152,16 +237,23 @@ async def websocket_flagged_courses(websocket: WebSocket, file_name: str):
         print(f"🌐 WebSocket error for {file_name}: {e}")
     finally:
         print(f"🌐 WebSocket cleanup triggered for {file_name}")
-        websocket_connections.pop(file_name, None)
-
         # Only close the WebSocket if it hasn't already been closed
-        if not websocket_closed_flags.get(file_name, False):
+        if not session.websocket_closed:
             await websocket.close()
         else:
             print(f"WebSocket for {file_name} already closed. Skipping duplicate closure.")
 
-        # Clean up the closed flag
-        websocket_closed_flags.pop(file_name, None)
+        # Detach this connection (unless a newer one has replaced it) and drop the session if processing is over
+        if session.websocket is websocket:
+            session.websocket = None
+        release_file_session(file_name)
+
+
+# Copy an uploaded file to disk in fixed-size chunks
+def save_upload_file(file: UploadFile, file_location: str):
+    file.file.seek(0)
+    with open(file_location, "wb") as f:
+        shutil.copyfileobj(file.file, f, length=UPLOAD_CHUNK_SIZE)
 
 
 @app.post("/upload")
@@ -172,25 +264,34 @@ async def upload_file(file: UploadFile = File(...)):
     This function is called sequentially for each file.
     """
     if not file:
-        return JSONResponse(status_code=400, content={"status": "error", "message": "No file uploaded"})
+        return ORJSONResponse(status_code=400, content={"status": "error", "message": "No file uploaded"})
 
-    check_database_status(DATABASE_FILE)
+    # Recreate the database only if it went missing since startup (blocking SQLite work stays off the event loop)
+    if not os.path.exists(DATABASE_FILE):
+        await asyncio.to_thread(check_database_status, DATABASE_FILE)
     
     file_name = file.filename
     print(f"File uploaded: {file_name}")
 
+    # Reject a second upload of a file that is still being processed (both would share its session and upload path)
+    if file_name in files_in_progress:
+        return ORJSONResponse(
+            status_code=409, 
+            content={"status": "error", "message": f"File is already being processed: {file_name}"}
+        )
+    files_in_progress.add(file_name)
+
     try:
         # Validate file formats
         if not is_allowed_file(file):
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=400, 
                 content={"status": "error", "message": f"File format not allowed: {file_name}"}
             )
         
         # Save file to server
         file_location = os.path.join(UPLOAD_FOLDER, file_name)
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
+        await asyncio.to_thread(save_upload_file, file, file_location)
         print(f"✅ File saved successfully: {file_location}")
 
         # Process the file
@@ -198,7 +299,7 @@ async def upload_file(file: UploadFile = File(...)):
         process_result = await process_file(file_location, DATABASE_FILE)
 
         if process_result["status"] == "error":
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=500,
                 content={
                     "status": "error",
@@ -210,7 +311,7 @@ async def upload_file(file: UploadFile = File(...)):
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"❌ Error processing {file_name}: {str(e)}")  # Log error in backend
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "status": "error",
@@ -218,9 +319,12 @@ async def upload_file(file: UploadFile = File(...)):
                 "details": error_details
             }
         )
+
+    finally:
+        files_in_progress.discard(file_name)
     
     # Return structured JSON response
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=200,
         content={
             "status": "success",
@@ -234,27 +338,30 @@ async def upload_file(file: UploadFile = File(...)):
 async def get_flagged_courses(file_name: str):
     """
     Retrieve flagged courses for a file and send via WebSocket. 
-    Retries if flagged courses are not yet available.
+    Waits until flagged courses are available or the timeout expires.
     """
     file_name = decode_file_name(file_name) # Decode spaces in filename
     print(f"Fetching flagged courses for {file_name}")
 
-    max_retries = 3  # Maximum number of retries
-    retry_delay = 1  # Delay between retries (in seconds)
-
-    for attempt in range(max_retries):
-        flagged_courses = flagged_courses_store.get(file_name, [])
-
-        if flagged_courses:
-            return JSONResponse(
-                status_code=200,
-                content={"status": "success", "flagged_courses": flagged_courses}
-            )
+    wait_timeout = 3  # Maximum time to wait for flagged courses (in seconds)
 
-        await asyncio.sleep(retry_delay)  # Wait before retrying
+    try:
+        # Wake up as soon as the pipeline stores the flagged courses
+        session = get_file_session(file_name)
+        await asyncio.wait_for(session.flagged_courses_ready.wait(), timeout=wait_timeout)
+    except asyncio.TimeoutError:
+        pass
+
+    flagged_courses = session.flagged_courses
+    release_file_session(file_name)  # Don't keep a session created only by this request
+    if flagged_courses:
+        return ORJSONResponse(
+            status_code=200,
+            content={"status": "success", "flagged_courses": flagged_courses}
+        )
 
-    print(f"❌ No flagged courses found after {max_retries} attempts for {file_name}.")
-    return JSONResponse(
+    print(f"❌ No flagged courses found after waiting {wait_timeout}s for {file_name}.")
+    return ORJSONResponse(
         status_code=400,
         content={"status": "error", "message": f"No flagged courses found for {file_name}."}
     )
@@ -270,53 +377,103 @@ async def submit_user_decisions(request: UserDecision):
     decisions = request.decisions
     print(f"Receiving user decisions for {file_name}")
 
-    if not file_name or file_name not in processing_lock:
-        return JSONResponse(
+    session = file_sessions.get(file_name)
+    if not file_name or session is None or session.processing_lock is None:
+        return ORJSONResponse(
             status_code=400,
             content={"status": "error", "message": "No active processing found."}
         )
 
     if not decisions:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=400,
             content={"status": "error", "message": "No decisions received from frontend."}
         )
 
     # Store user decisions
-    user_decisions_store[file_name] = decisions
+    session.user_decisions = decisions
 
     # Resume processing in data_pipeline.py
-    processing_lock[file_name].set() 
+    session.processing_lock.set() 
     
     #Notify frontend that processing is completed before closing WebSocket
     await notify_status(file_name, "intentional_closure") 
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=200,
         content={"status": "success", "message": "Decisions received. Processing will resume."}
     )
 
 
+SEARCH_NOTES = """Note: A course with 0 credit may fall into one of the following cases: 
+                        1. The course is not an actual academic course but is designed for administrative or tracking purposes. 
+                        2. The educator did not pass the course.
+                    """
+
+
+# Query transcripts and build the search summary (blocking; runs on a worker thread)
+def run_search(criteria_dict: dict) -> dict:
+    """
+    Queries transcripts with a pooled connection and builds the summary.
+    Args:
+        criteria_dict (dict): Search parameters.
+    Returns:
+        dict: Search outcome with status "error", "not_found", or "success" (with the serialized response body).
+    """
+    with get_db_connection() as conn:
+        results = query_transcripts(conn, criteria_dict)
+
+    # Handling errors from query_transcripts()
+    if isinstance(results, str) and results == "error":
+        return {"status": "error"}
+
+    # If no results are found
+    if results is None:
+        return {"status": "not_found"}
+
+    # Rename the queried columns for display in place (the frame is owned here, so no copy is needed)
+    df = results
+    df.columns = [
+        "Educator First Name", "Educator Middle Name", "Educator Last Name", 
+        "Degree", "Degree Level", "Course Name", "Course Category", "Adjusted Credits Earned"
+    ]
+
+    # Generate a summary DataFrame
+    summary_df = generate_summary_df(criteria_dict, df)
+
+    # Take the educator's name from the first row when searching by name
+    educator_name = ""
+    if criteria_dict.get("educator_first_name") and criteria_dict.get("educator_last_name"):
+        educator_name = f"{df.iat[0, 0]} {df.iat[0, 2]}"
+
+    # Serialize the response body here as well, so the event loop only has to send the bytes
+    return {
+        "status": "success",
+        "body": orjson.dumps({
+            "status": "success",
+            "queried_data": summary_df.to_dict(orient="records"),
+            "educator_name": educator_name,
+            "message": "Transcripts retrieved successfully.",
+            "notes": SEARCH_NOTES
+        })
+    }
+
+
 @app.post("/search")
-def search_transcripts(criteria: SearchCriteria):
+async def search_transcripts(criteria: SearchCriteria):
     """
     Searches transcripts based on educator name, course category, degree level.
     Args:
         criteria (SearchCriteria): Search parameters.
-        conn (Connection): Database connection object.
     Returns:
-        JSONResponse: Queried results.
+        ORJSONResponse: Queried results.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        criteria_dict = criteria.model_dump()
-        results = query_transcripts(conn, criteria_dict)
-            
-        # Handling errors from query_transcripts()
-        if results == "error":
-            return JSONResponse(
+        # Run the query and summary on a worker thread so the event loop stays responsive
+        search_result = await asyncio.to_thread(run_search, criteria.model_dump())
+
+        if search_result["status"] == "error":
+            return ORJSONResponse(
                 status_code=500,
                 content={
                     "status": "error",
@@ -325,9 +482,8 @@ def search_transcripts(criteria: SearchCriteria):
                 }
             )
         
-        # If no results are found
-        if results is None:
-            return JSONResponse(
+        if search_result["status"] == "not_found":
+            return ORJSONResponse(
                 status_code=404,
                 content={
                     "status": "not_found",
@@ -336,18 +492,9 @@ def search_transcripts(criteria: SearchCriteria):
                 }
             )
 
-        # Convert to Pandas DataFrame
-        df = pd.DataFrame(results, columns=[
-            "Educator First Name", "Educator Middle Name", "Educator Last Name", 
-            "Degree", "Degree Level", "Course Name", "Course Category", "Adjusted Credits Earned"
-        ])
-
-        # Generate a summary DataFrame
-        summary_df = generate_summary_df(criteria_dict, df)
-
     except Exception as e:
         print(f"❌ Search failed: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "status": "error",
@@ -356,24 +503,4 @@ def search_transcripts(criteria: SearchCriteria):
             }
         )
 
-    finally:
-        cursor.close()
-        conn.close()  # Ensure the database connection is closed
-
-    return JSONResponse(
-        status_code=200,
-        content={
-            "status": "success",
-            "queried_data": summary_df.to_dict(orient="records"),
-            "educator_name": (
-                f"{df['Educator First Name'].iloc[0]} {df['Educator Last Name'].iloc[0]}"
-                if not df.empty and criteria_dict.get("educator_first_name") and criteria_dict.get("educator_last_name") 
-                else ""
-            ),
-            "message": "Transcripts retrieved successfully.",
-            "notes": """Note: A course with 0 credit may fall into one of the following cases: 
-                        1. The course is not an actual academic course but is designed for administrative or tracking purposes. 
-                        2. The educator did not pass the course.
-                    """
-        }
-    )
+    return Response(status_code=200, content=search_result["body"], media_type="application/json")
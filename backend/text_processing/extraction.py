@@ -1,59 +1,77 @@
 
 import pypdfium2 as pdfium
-from PIL import Image
 import cv2
 import pytesseract
 import os
 import csv
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
 
 
-# Convert PDF pages to images
-def pdf_to_images(pdf_path, image_output_dir):
+# Number of pages OCR'd at the same time (each Tesseract call runs in its own process)
+OCR_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# Polling intervals for the Azure Read API (seconds): start short, back off up to the maximum
+AZURE_POLL_INITIAL_INTERVAL = 0.25
+AZURE_POLL_MAX_INTERVAL = 2.0
+
+# Tesseract options: use the LSTM engine only (skips loading the legacy engine's data for each call)
+TESSERACT_CONFIG = "--oem 1"
+
+
+# Render PDF pages to grayscale images in memory
+def pdf_to_images(pdf_path):
     """
-    Converts PDF pages to images and saves them with a name combining the PDF name and page number.
+    Renders PDF pages to grayscale images one page at a time, without writing them to disk.
     Args:
         pdf_path (str): Path to the PDF file.
-        image_output_dir (str): Directory to save the images.
+    Yields:
+        numpy.ndarray: Grayscale image of each page, in page order.
     """
     try: 
         # Load the PDF file
         pdf = pdfium.PdfDocument(pdf_path)
 
-        # Extract the base name of the PDF (without path or extension)
-        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-
-        # Ensure output directory exists
-        os.makedirs(image_output_dir, exist_ok=True)  
-
-        # Iterate over each page
-        for i in range(len(pdf)):
-            # Get page
-            page = pdf[i]
+        try:
+            # Iterate over each page
+            for i in range(len(pdf)):
+                # Get page
+                page = pdf[i]
 
-            # Render the page to an image
-            pdf_bitmap = page.render(scale=4.0)  # Adjust scale for higher resolution
+                # Render the page straight to a grayscale bitmap and view it as a NumPy array
+                pdf_bitmap = page.render(scale=4.0, grayscale=True)  # Adjust scale for higher resolution
+                yield pdf_bitmap.to_numpy()
 
-            # Convert PdfBitmap to a Pillow Image
-            pil_image = Image.frombytes("RGB", (pdf_bitmap.width, pdf_bitmap.height), pdf_bitmap.buffer)
-
-            # Save the image with a name combining PDF name and page number
-            image_path = os.path.join(image_output_dir, f"{pdf_name}_page_{i + 1}.jpg")
-            pil_image.save(image_path)
-            print(f"Saved: {image_path}")
+        finally:
+            pdf.close()
 
     except Exception as e:
         print(f"Error processing PDF {pdf_path}: {str(e)}")
 
 
+# Preprocess a grayscale image for OCR
+def binarize_image(gray):
+    """
+    Denoises a grayscale image and binarizes it with Otsu's threshold.
+    Args:
+        gray (numpy.ndarray): Grayscale image.
+    Returns:
+        numpy.ndarray: Binary image.
+    """
+    # Preprocess the image (optional: denoising, thresholding)
+    gray = cv2.medianBlur(gray, 3)
+    _, binary_image = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary_image
+
+
 # Extract text from a file using opencv
-def extract_text_from_file_using_opencv(file_path, image_output_dir):
+def extract_text_from_file_using_opencv(file_path):
     """
     Extract text from a PDF file or image using OpenCV and Tesseract.
     Args:
         file_path (str): Path to the local file (PDF or image).
-        image_output_dir (str): Path to the image output directory.
     Returns:
         str: Extracted text.
     """
@@ -62,50 +80,34 @@ def extract_text_from_file_using_opencv(file_path, image_output_dir):
         file_extension = os.path.splitext(file_path)[-1].lower()
 
         if file_extension == ".pdf":
-            # Convert PDF to images
-            pdf_to_images(file_path, image_output_dir)
-
-            # Extract the base name of the PDF (without path or extension)
-            pdf_name = os.path.splitext(os.path.basename(file_path))[0]
-
-            # Find all images associated with the PDF file
-            images = [f for f in os.listdir(image_output_dir) if f.startswith(pdf_name) and f.endswith(".jpg")]
+            # Render the PDF pages in memory
+            pages = pdf_to_images(file_path)
 
         elif file_extension in [".jpg", ".jpeg", ".png"]:
-            # If the file is already an image, use it directly
-            images = [file_path]
+            # If the file is already an image, read it and convert it to grayscale
+            image = cv2.imread(file_path)
+            if image is None:
+                print(f"Skipping unreadable image: {file_path}")
+                pages = []
+            else:
+                pages = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)]
 
         else:
             print(f"Unsupported file format: {file_extension}")
-            images = []
-
-        extracted_text = []
-        for image_name in sorted(images):  # Sort to process in page order
-            image_path = os.path.join(image_output_dir, image_name) if file_extension == ".pdf" else image_name
+            pages = []
+
+        # Binarize each page as it is rendered and OCR the pages concurrently (results keep page order);
+        # rendering waits while OCR_MAX_WORKERS pages are in flight, so only a few page images are held in memory
+        pages_in_flight = threading.BoundedSemaphore(OCR_MAX_WORKERS)
+        futures = []
+        with ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS) as executor:
+            for gray in pages:
+                pages_in_flight.acquire()
+                future = executor.submit(pytesseract.image_to_string, binarize_image(gray), config=TESSERACT_CONFIG)
+                future.add_done_callback(lambda _: pages_in_flight.release())
+                futures.append(future)
+        extracted_text = "\n".join(future.result() for future in futures)
 
-            # Read the image using OpenCV
-            image = cv2.imread(image_path)
-            if image is None:
-                print(f"Skipping unreadable image: {image_path}")
-                continue
-
-            # Convert the image to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-            # Preprocess the image (optional: denoising, thresholding)
-            gray = cv2.medianBlur(gray, 3)
-            _, binary_image = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-            # Perform OCR using Tesseract
-            extracted_text.append(pytesseract.image_to_string(binary_image))
-        extracted_text = "\n".join(extracted_text)
-
-        # Delete images after processing
-        if file_extension == ".pdf":
-            print("Deleting images...")
-            for image_name in images:
-                os.remove(os.path.join(image_output_dir, image_name))
-            
         return extracted_text.strip()
 
     except Exception as e:
@@ -140,13 +142,15 @@ def extract_text_from_file_using_azure(file_path, azure_client):
         # Extract operation ID from the URL
         operation_id = operation_location.split("/")[-1]
 
-        # Wait for the Read API to finish processing
+        # Wait for the Read API to finish processing, polling quickly at first and backing off
         print("Processing...")
+        poll_interval = AZURE_POLL_INITIAL_INTERVAL
         while True:
             result = azure_client.get_read_result(operation_id)
             if result.status not in [OperationStatusCodes.not_started, OperationStatusCodes.running]:
                 break
-            time.sleep(1)
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, AZURE_POLL_MAX_INTERVAL)
 
         # Extract text from the results
         extracted_text = ""
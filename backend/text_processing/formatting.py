@@ -1,11 +1,14 @@
 import os
 import csv
 import json
+import orjson
 import re
 import regex
-import pandas as pd
-import numpy as np
-from datetime import datetime
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
 from dateutil import parser
 from clients_service import get_openai_client
 
@@ -14,6 +17,16 @@ from clients_service import get_openai_client
 TEMPERATURE = 0.2 # Lower value for more deterministic, precise, and consistent
 
 
+# Output token limit for transcript extraction (gpt-4o-mini's maximum, long transcripts must not be cut off)
+MAX_OUTPUT_TOKENS = 16384
+
+# Extracted data dicts of recently processed transcripts, keyed by a hash of the transcript text
+# (re-uploading a transcript OCRs to the same text, so its extraction can be reused)
+EXTRACTION_CACHE_SIZE = 128
+extraction_cache = OrderedDict()
+extraction_cache_lock = threading.Lock()
+
+
 # List of minor words that should remain lowercase (unless first word)
 MINOR_WORDS = {"of", "the", "in", "and", "for", "at", "to", "with", "on", "as", "by"}
 
@@ -22,25 +35,21 @@ MINOR_WORDS = {"of", "the", "in", "and", "for", "at", "to", "with", "on", "as",
 SPECIAL_WORDS = {"phd.": "PhD.", "esl": "ESL", "mba": "MBA", "bsc": "BSc", "msc": "MSc"}
 
 
-# Function to process text using OpenAI API
-def generate_data_dict_using_openai(text, temperature: float = TEMPERATURE):
-    """
-    Calls OpenAI API to extract and structure transcript data into JSON format.
-    Args:
-        text (str): Extracted text from the transcript.
-        temperature (float): OpenAI model temperature for response variation.
-    Returns:
-        dict | None: Parsed JSON data or None if extraction fails.
-    """
-    openai_client = get_openai_client()
+# Common date layouts parsed without dateutil (the extraction prompt asks for yyyy-mm-dd)
+ISO_DATE_PATTERN = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+US_DATE_PATTERN = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
 
-    prompt = f"""
+# Static parts of the transcript extraction prompt, built once at import
+EXTRACTION_SYSTEM_PROMPT = "You are an OCR expert in extracting text from academic transcript images with high accuracy and returning structured JSON data."
+
+EXTRACTION_PROMPT_PREFIX = """
     Extract and organize the following data into a **JSON object**.
     The JSON **must** follow this structure:
     ```json
-    {{
+    {
         "degrees": [
-            {{
+            {
                 "degree": "",
                 "major": "",
                 "minor": "",
@@ -49,24 +58,22 @@ def generate_data_dict_using_openai(text, temperature: float = TEMPERATURE):
                 "overall_credits_earned": "",
                 "overall_gpa": "",
                 "courses": [
-                    {{
+                    {
                         "course_name": "",
                         "credits_earned": "",
                         "grade": ""
-                    }}
+                    }
                 ]
-            }}
+            }
         ],
-        "student": {{
+        "student": {
             "first_name": "",
             "middle_name": "",
             "last_name": ""
-        }}
-    }}
+        }
+    }
     ```
     **Instructions (STRICT RULES)**:
-    - Return only JSON, with no extra text, comments, or markdown formatting.
-    - No explanations, just the JSON output.
     - If a field is missing from the input, return it as an empty string ("") in the JSON output.
     - Only return data that is **explicitly found** in the intput. **Never fabricate, assume, infer, or guess missing values, unless it's instructed**.
     - The dictionary keys must match the exact structure specified.
@@ -88,32 +95,68 @@ def generate_data_dict_using_openai(text, temperature: float = TEMPERATURE):
 
     **Input Data:**
     ```
-    {text}
+"""
+
+EXTRACTION_PROMPT_SUFFIX = """
     ```
-    **Output Format:** Return **ONLY** a valid JSON object. 
     """
+
+
+# Function to process text using OpenAI API
+def generate_data_dict_using_openai(text, temperature: float = TEMPERATURE):
+    """
+    Calls OpenAI API to extract and structure transcript data into JSON format.
+    Args:
+        text (str): Extracted text from the transcript.
+        temperature (float): OpenAI model temperature for response variation.
+    Returns:
+        dict | None: Parsed JSON data or None if extraction fails.
+    """
+    # Reuse the extraction of an identical transcript text (copied, callers modify the dict)
+    cache_key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), temperature)
+    with extraction_cache_lock:
+        if cache_key in extraction_cache:
+            extraction_cache.move_to_end(cache_key)
+            print("Reusing cached extraction for identical transcript text.")
+            return copy.deepcopy(extraction_cache[cache_key])
+
+    openai_client = get_openai_client()
+
+    prompt = EXTRACTION_PROMPT_PREFIX + text + EXTRACTION_PROMPT_SUFFIX
     try:
         response = openai_client.chat.completions.create(
             model="gpt-4o-mini",  # Use GPT-4 for better accuracy
             messages=[
-                {"role": "system", "content": "You are an OCR expert in extracting text from academic transcript images with high accuracy and returning structured JSON data."},
+                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            #max_tokens=2000,
-            temperature=temperature
+            response_format={"type": "json_object"},  # Server-side JSON mode, no markdown fences to strip
+            max_tokens=MAX_OUTPUT_TOKENS,
+            temperature=temperature,
+            stream=False
         )
         
+        # A response cut off at the token limit is incomplete JSON
+        if response.choices[0].finish_reason == "length":
+            print(f"OpenAI response was truncated at {MAX_OUTPUT_TOKENS} output tokens. The transcript is too long to extract in one request.")
+            return None
+
         structured_text = response.choices[0].message.content.strip()
 
         if not structured_text:
             print("OpenAI returned an empty response.")
             return None
 
-        # Remove code block formatting if present
-        structured_text = structured_text.replace("```json", "").replace("```", "").strip()
+        # Parse JSON
+        data_dict = orjson.loads(structured_text)
+
+        # Cache a copy of the extraction, evicting the least recently used one when full
+        with extraction_cache_lock:
+            extraction_cache[cache_key] = copy.deepcopy(data_dict)
+            if len(extraction_cache) > EXTRACTION_CACHE_SIZE:
+                extraction_cache.popitem(last=False)
 
-        # Ensure the response is valid JSON
-        return json.loads(structured_text)  # Parse JSON
+        return data_dict
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
@@ -134,18 +177,14 @@ def deduplicate_courses(data_dict):
         dict: The cleaned dictionary with duplicates removed
     """
     for degree in data_dict.get("degrees", []):
-        unique_courses = []
-        seen_courses = set()
+        unique_courses = {}  # Keeps the first course for each key, in order
 
         for course in degree.get("courses", []):
             course_key = (course.get("course_name", ""), course.get("credits_earned", ""), course.get("grade", ""))
-            
-            if course_key not in seen_courses:
-                unique_courses.append(course)
-                seen_courses.add(course_key)
+            unique_courses.setdefault(course_key, course)
 
         # Update the courses list with deduplicated records
-        degree["courses"] = unique_courses
+        degree["courses"] = list(unique_courses.values())
 
     return data_dict
     
@@ -175,7 +214,19 @@ def format_date(date_str):
         return None
 
     try:
-        # Auto-detect date format and convert to YYYY-MM-DD
+        # Fast path for yyyy-mm-dd and mm/dd/yyyy
+        date_str = date_str.strip()
+        if match := ISO_DATE_PATTERN.fullmatch(date_str):
+            year, month, day = match.groups()
+        elif match := US_DATE_PATTERN.fullmatch(date_str):
+            month, day, year = match.groups()
+        if match:
+            try:
+                return date(int(year), int(month), int(day)).isoformat()
+            except ValueError:
+                pass  # Not a valid date in this layout (e.g. dd/mm/yyyy), let dateutil decide
+
+        # Auto-detect any other date format and convert to YYYY-MM-DD
         parsed_date = parser.parse(date_str)
         return parsed_date.strftime("%Y-%m-%d")
     except ValueError:
@@ -256,47 +307,3 @@ def preprocess_data_dict(data_dict: dict) -> dict:
 
     return formatted_data
 
-
-# Function to convert JSON data to a Pandas DataFrame
-def json_data_to_dataframe(json_data):
-    """
-    Converts structured JSON data into a Pandas DataFrame.
-    Args:
-        json_data (dict): Extracted structured data.
-    Returns:
-        pd.DataFrame | None: Returns a formatted DataFrame or None if processing fails.
-    """
-    try:
-        # Extract course-related fields (multi-value)
-        course_names = json_data.get("course_name", [])
-        credits_earned = json_data.get("credits_earned", [])
-        grades = json_data.get("grade", [])
-
-        # Ensure all course-related lists have the same length
-        max_len = max(len(course_names), len(credits_earned), len(grades))
-        course_names += [""] * (max_len - len(course_names))
-        credits_earned += [""] * (max_len - len(credits_earned))
-        grades += [""] * (max_len - len(grades))
-
-        # Create a DataFrame with expanded course details
-        df = pd.DataFrame({
-            "first_name": [json_data.get("student_firstName", [""])[0]] * max_len,
-            "middle_name": [json_data.get("student_middleName", [""])[0] if json_data.get("student_middleName") else ""] * max_len,
-            "last_name": [json_data.get("student_lastName", [""])[0]] * max_len,
-            "institution_name": [json_data.get("institution_name", [""])[0]] * max_len,
-            "degree": [json_data.get("degree", [""])[0] if json_data.get("degree") else ""] * max_len,
-            "major": [json_data.get("major", [""])[0] if json_data.get("major") else ""] * max_len,
-            "minor": [json_data.get("minor", [""])[0] if json_data.get("minor") else ""] * max_len,
-            "awarded_date": [json_data.get("awarded_date", [""])[0] if json_data.get("awarded_date") else ""] * max_len,
-            "overall_credits_earned": [json_data.get("overall_credits_earned", [""])[0] if json_data.get("overall_credits_earned") else ""] * max_len,
-            "overall_gpa": [json_data.get("overall_gpa", [""])[0] if json_data.get("overall_gpa") else ""] * max_len,
-            "course_name": course_names,
-            "credits_earned": credits_earned,
-            "grade": grades
-        })
-
-        return df
-
-    except Exception as e:
-        print(f"Error converting JSON to DataFrame: {e}")
-        return None
@@ -1,9 +1,13 @@
 import os
 import csv
 import json
+import orjson
+import time
+import threading
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from collections import OrderedDict
+from functools import lru_cache
 from clients_service import get_openai_client, get_sbert_model
 
 
@@ -13,6 +17,11 @@ THRESHOLD = 0.7  # Matches below this threshold will be marked as "Uncategorized
 # Set a randomness level for OpenAI
 TEMPERATURE = 0.2 # Lower value for more deterministic, precise, and consistent
 
+# Categories already matched by OpenAI, keyed by course name (transcripts share many course names)
+COURSE_CATEGORY_CACHE_SIZE = 10000  # Least recently used course names are evicted beyond this
+course_category_cache = OrderedDict()
+course_category_cache_lock = threading.Lock()
+
 
 # Function to get the best match for a course name using OpenAI
 def match_courses_using_openai(course_names: list, categories_dict: dict, temperature: float = TEMPERATURE) -> list:
@@ -25,6 +34,17 @@ def match_courses_using_openai(course_names: list, categories_dict: dict, temper
     Returns:
         list: List of matched categories.
     """
+    # Only ask OpenAI about course names that were not matched before, each name once
+    cached = {}
+    with course_category_cache_lock:
+        for name in course_names:
+            if name in course_category_cache:
+                course_category_cache.move_to_end(name)
+                cached[name] = course_category_cache[name]
+    pending_names = list(dict.fromkeys(name for name in course_names if name not in cached))
+    if not pending_names:
+        return [cached[name] for name in course_names]
+
     openai_client = get_openai_client()
     retry_attempts = 3
     
@@ -39,7 +59,7 @@ def match_courses_using_openai(course_names: list, categories_dict: dict, temper
     - If multiple categories are relevant, choose the **most specific** category.
     - Return the classification as a **valid JSON list** where each course matches the respective category.
     
-    **Courses:** {course_names}
+    **Courses:** {pending_names}
     
     **Categories (with Descriptions):**
     {categories_prompt}
@@ -66,14 +86,28 @@ def match_courses_using_openai(course_names: list, categories_dict: dict, temper
                 return []  
             
             # Remove code block formatting (if present)
-            structured_text = structured_text.replace("```json", "").replace("```", "").strip()
+            structured_text = structured_text.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
             
             # Ensure the response is valid JSON
-            category_matches = json.loads(structured_text)  # Parse JSON
+            category_matches = orjson.loads(structured_text)  # Parse JSON
 
             # Validate output format
-            if isinstance(category_matches, list) and len(category_matches) == len(course_names):
-                return category_matches
+            if isinstance(category_matches, list) and len(category_matches) == len(pending_names):
+                # Map every course name (new or cached) to its category, then remember the new matches
+                matches = dict(zip(pending_names, category_matches))
+                categories = [
+                    matches[name] if name in matches else cached[name]
+                    for name in course_names
+                ]
+                # Only cache real categories, so an invented one or "Uncategorized" is asked again next time
+                with course_category_cache_lock:
+                    for name, category in matches.items():
+                        if isinstance(category, str) and category in categories_dict:
+                            course_category_cache[name] = category
+                            course_category_cache.move_to_end(name)
+                            if len(course_category_cache) > COURSE_CATEGORY_CACHE_SIZE:
+                                course_category_cache.popitem(last=False)
+                return categories
 
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON (Attempt {attempt+1}/{retry_attempts}): {e}")
@@ -82,8 +116,21 @@ def match_courses_using_openai(course_names: list, categories_dict: dict, temper
             print(f"API error (Attempt {attempt+1}/{retry_attempts}): {e}")
             time.sleep(2)
 
-    print("All retry attempts failed. Returning 'Uncategorized' for all courses.")
-    return ["Uncategorized"] * len(course_names) # Default to Uncategorized
+    print("All retry attempts failed. Returning 'Uncategorized' for the unmatched courses.")
+    return [cached.get(name, "Uncategorized") for name in course_names] # Default to Uncategorized
+
+
+# Encode category names with SBERT (cached, the categories are the same for every file)
+@lru_cache(maxsize=8)
+def get_category_embeddings(categories: tuple) -> np.ndarray:
+    """
+    Generates L2-normalized SBERT embeddings for a set of category names.
+    Args:
+        categories (tuple): Category names (a tuple so the result can be cached).
+    Returns:
+        np.ndarray: One normalized embedding per category.
+    """
+    return get_sbert_model().encode(list(categories), convert_to_numpy=True, normalize_embeddings=True)
 
 
 # Function to get the best match for a course name using SBERT
@@ -109,23 +156,29 @@ def match_courses_using_sbert(course_names: list, categories_list: list, thresho
         # Extract unique categories in lowercase
         unique_categories = sorted(category_mapping.keys())
 
-        # Generate SBERT embeddings
+        # Encode each distinct course name once (transcripts often repeat course names)
+        unique_course_names = list(dict.fromkeys(course_names))
+
+        # Generate normalized SBERT embeddings (category embeddings are cached across calls)
         print("Generating SBERT embeddings for matching...")
-        course_name_embeddings = sbert_model.encode(course_names, convert_to_numpy=True)
-        category_embeddings = sbert_model.encode(unique_categories, convert_to_numpy=True)
+        course_name_embeddings = sbert_model.encode(
+            unique_course_names, batch_size=64, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True
+        )
+        category_embeddings = get_category_embeddings(tuple(unique_categories))
 
-        # Compute cosine similarity
-        similarity_matrix = cosine_similarity(course_name_embeddings, category_embeddings)
+        # Compute cosine similarity (a dot product, since the embeddings are normalized)
+        similarity_matrix = course_name_embeddings @ category_embeddings.T
 
-        # Find the best match for each course name
+        # Find the best match for each distinct course name
         best_match_indices = np.argmax(similarity_matrix, axis=1)
         best_match_scores = np.max(similarity_matrix, axis=1)
 
-        # Assign matched categories based on threshold
-        matched_categories = [
-            category_mapping[unique_categories[idx]] if score >= threshold else "Uncategorized"
-            for idx, score in zip(best_match_indices, best_match_scores)
-        ]
+        # Assign matched categories based on threshold, then map them back to every course name
+        matched_by_name = {
+            course_name: category_mapping[unique_categories[idx]] if score >= threshold else "Uncategorized"
+            for course_name, idx, score in zip(unique_course_names, best_match_indices, best_match_scores)
+        }
+        matched_categories = [matched_by_name[course_name] for course_name in course_names]
 
         return matched_categories
 
@@ -5,9 +5,11 @@ import regex
 import pandas as pd
 import numpy as np
 import json
+import orjson
 from datetime import datetime
 from dateutil import parser
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from clients_service import get_openai_client
 from utils import get_valid_value
 
@@ -15,6 +17,15 @@ from utils import get_valid_value
 # Set a randomness level for OpenAI
 TEMPERATURE = 0.2 # Lower value for more deterministic, precise, and consistent
 
+# Response format for every OpenAI validation request (server-side JSON mode, no markdown fences to strip)
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Maximum number of OpenAI validation requests in flight at once
+MAX_CONCURRENT_REQUESTS = 10
+
+# Maximum number of courses validated in one OpenAI request (keeps each response well under the output token limit)
+COURSES_PER_VALIDATION_REQUEST = 50
+
 
 # Define validation regex patterns
 PATTERNS = {
@@ -127,6 +138,7 @@ def validate_name_openai(first_name, middle_name, last_name, temperature: float
                 {"role": "system", "content": "You are an OCR expert in validating human name details."},
                 {"role": "user", "content": prompt}
             ],
+            response_format=JSON_RESPONSE_FORMAT,
             temperature=temperature
         )
         result = response.choices[0].message.content.strip()
@@ -135,11 +147,8 @@ def validate_name_openai(first_name, middle_name, last_name, temperature: float
             print("OpenAI returned an empty response.")
             return None
 
-        # Remove code block formatting if present
-        result = result.replace("```json", "").replace("```", "").strip()
-
         # Ensure the response is valid JSON
-        return json.loads(result)  # Parse JSON
+        return orjson.loads(result)  # Parse JSON
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
@@ -184,6 +193,7 @@ def validate_academic_info_openai(institution_name, degree, major, minor, temper
                 {"role": "system", "content": "You are an OCR expert in validating academic information."},
                 {"role": "user", "content": prompt}
             ],
+            response_format=JSON_RESPONSE_FORMAT,
             temperature=temperature
         )
         result = response.choices[0].message.content.strip()
@@ -192,11 +202,8 @@ def validate_academic_info_openai(institution_name, degree, major, minor, temper
             print("OpenAI returned an empty response.")
             return None
 
-        # Remove code block formatting if present
-        result = result.replace("```json", "").replace("```", "").strip()
-
         # Ensure the response is valid JSON
-        return json.loads(result)  # Parse JSON
+        return orjson.loads(result)  # Parse JSON
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
@@ -234,6 +241,7 @@ def validate_awarded_date_openai(awarded_date, temperature: float = TEMPERATURE)
                 {"role": "system", "content": "You are an OCR expert in validating academic degree awarded date format."},
                 {"role": "user", "content": prompt}
             ],
+            response_format=JSON_RESPONSE_FORMAT,
             temperature=temperature
         )
         result = response.choices[0].message.content.strip()
@@ -242,11 +250,8 @@ def validate_awarded_date_openai(awarded_date, temperature: float = TEMPERATURE)
             print("OpenAI returned an empty response.")
             return None
 
-        # Remove code block formatting if present
-        result = result.replace("```json", "").replace("```", "").strip()
-
         # Ensure the response is valid JSON
-        return json.loads(result)  # Parse JSON
+        return orjson.loads(result)  # Parse JSON
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
@@ -287,6 +292,7 @@ def validate_academic_performance_openai(overall_credits_earned, overall_gpa, te
                 {"role": "system", "content": "You are an OCR expert in validating academic performance indicators."},
                 {"role": "user", "content": prompt}
             ],
+            response_format=JSON_RESPONSE_FORMAT,
             temperature=temperature
         )
         result = response.choices[0].message.content.strip()
@@ -295,11 +301,8 @@ def validate_academic_performance_openai(overall_credits_earned, overall_gpa, te
             print("OpenAI returned an empty response.")
             return None
 
-        # Remove code block formatting if present
-        result = result.replace("```json", "").replace("```", "").strip()
-
         # Ensure the response is valid JSON
-        return json.loads(result)  # Parse JSON
+        return orjson.loads(result)  # Parse JSON
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
@@ -310,21 +313,37 @@ def validate_academic_performance_openai(overall_credits_earned, overall_gpa, te
         return None
 
 
-# Function to validate course_name, credits_earned, and grade using OpenAI
-def validate_coursework_openai(course_name, credits_earned, grade, temperature: float = TEMPERATURE):
+# Function to validate a batch of courses (course_name, credits_earned, grade) in a single OpenAI call
+def validate_courses_openai(courses: list, temperature: float = TEMPERATURE) -> list:
+    """
+    Validates several courses with one OpenAI request instead of one request per course.
+    Args:
+        courses (list): List of dictionaries with course_name, credits_earned, and grade.
+        temperature (float): OpenAI model temperature for response variation.
+    Returns:
+        list: Corrected course dictionaries aligned with the input order (empty dict where no correction was returned).
+    """
+    if not courses:
+        return []
+
     openai_client = get_openai_client()
 
+    # Enumerate the courses so the response can be aligned by id
+    courses_prompt = "\n".join(
+        f"[{i}] Course Name: {course['course_name']} | Credits Earned: {course['credits_earned']} | Grade: {course['grade']}"
+        for i, course in enumerate(courses, start=1)
+    )
+
     prompt = f"""
     Validate the following course details:
-    - Course Name: {course_name}
-    - Credits Earned: {credits_earned}
-    - Grade: {grade}
+    {courses_prompt}
 
-    Check if the course is commonly offered, if the credits make sense, and whether the grade is a valid academic grade.
+    Check if each course is commonly offered, if the credits make sense, and whether the grade is a valid academic grade.
     
     **Rules:**
     - Return only JSON, with no extra text, comments, or markdown formatting.
     - No explanations, just the JSON output.
+    - Return exactly one object per input course, with "id" set to the number shown in brackets.
     - If a field is empty, leave it as an empty value.
     - Capitalize only important words. Keep minor words lowercase (e.g., "of", "in", "the") unless they start a sentence. Leave all abbreviations capitalized.
     - Check for statistical anomalies in credits earned, but **DO NOT modify credits that already match standard academic formats (e.g., 3.0, 7.5, 15.0, 30.0, etc.).**
@@ -332,13 +351,16 @@ def validate_coursework_openai(course_name, credits_earned, grade, temperature:
     - If a grade is a numeric grade, do not convert it to a letter grade, and vice versa. The grade should be returned as a string.
     - If uncertain, return the original value without modifications.
     
-    Return the corrections as a JSON object following this structure:
+    Return the corrections as a JSON list following this structure:
     ```json
-    {{
-        "course_name": "",
-        "credits_earned": 0.0,
-        "grade": ""
-    }}
+    [
+        {{
+            "id": 1,
+            "course_name": "",
+            "credits_earned": 0.0,
+            "grade": ""
+        }}
+    ]
     ```
     """
     try: 
@@ -350,25 +372,44 @@ def validate_coursework_openai(course_name, credits_earned, grade, temperature:
             ],
             temperature=temperature
         )
+        # A response cut off at the token limit is incomplete JSON
+        if response.choices[0].finish_reason == "length":
+            print(f"OpenAI response was truncated while validating {len(courses)} courses. Keeping the original values.")
+            return [{} for _ in courses]
+
         result = response.choices[0].message.content.strip()
 
         if not result:
             print("OpenAI returned an empty response.")
-            return None
+            return [{} for _ in courses]
 
         # Remove code block formatting if present
-        result = result.replace("```json", "").replace("```", "").strip()
+        result = result.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
 
         # Ensure the response is valid JSON
-        return json.loads(result)  # Parse JSON
+        corrections = orjson.loads(result)  # Parse JSON
+        if not isinstance(corrections, list):
+            print("OpenAI response is not a JSON list.")
+            return [{} for _ in courses]
+
+        # Align corrections with the input courses by id (the model may return ids as strings, e.g. "3")
+        corrections_by_id = {}
+        for correction in corrections:
+            if not isinstance(correction, dict):
+                continue
+            try:
+                corrections_by_id[int(correction.get("id"))] = correction
+            except (TypeError, ValueError):
+                continue  # Skip corrections without a usable id
+        return [corrections_by_id.get(i, {}) for i in range(1, len(courses) + 1)]
 
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON: {e}")
         print("OpenAI Response:", result)
-        return None
+        return [{} for _ in courses]
     except Exception as e:
         print(f"OpenAI API error: {e}")
-        return None
+        return [{} for _ in courses]
 
 
 # Function to validate each value of a dictionary using OpenAI-based validation functions
@@ -385,62 +426,92 @@ def openai_based_validation(data_dict) -> dict:
     corrected_data = {"student": {}, "degrees": []}
     
     try:
-        # Validate Name Fields
-        first_name = get_valid_value(data_dict.get("student", {}).get("first_name"))
-        middle_name = get_valid_value(data_dict.get("student", {}).get("middle_name"))
-        last_name = get_valid_value(data_dict.get("student", {}).get("last_name"))
-        corrected_names = validate_name_openai(first_name, middle_name, last_name) or {}
-
-        corrected_data["student"]["first_name"] = get_valid_value(corrected_names.get("first_name"), first_name)
-        corrected_data["student"]["middle_name"] = get_valid_value(corrected_names.get("middle_name"), middle_name)
-        corrected_data["student"]["last_name"] = get_valid_value(corrected_names.get("last_name"), last_name)
-
-        # Validate and correct degrees
-        for degree in data_dict.get("degrees", []):
-            corrected_degree = {}
-
-            # Validate Academic Information (Institution, Degree, Major, Minor)
-            institution_name = get_valid_value(degree.get("institution_name"))
-            degree_name = get_valid_value(degree.get("degree"))
-            major = get_valid_value(degree.get("major"))
-            minor = get_valid_value(degree.get("minor"))
-            corrected_academic_info = validate_academic_info_openai(institution_name, degree_name, major, minor) or {}
-
-            corrected_degree["institution_name"] = get_valid_value(corrected_academic_info.get("institution_name"), institution_name)
-            corrected_degree["degree"] = get_valid_value(corrected_academic_info.get("degree"), degree_name)
-            corrected_degree["major"] = get_valid_value(corrected_academic_info.get("major"), major)
-            corrected_degree["minor"] = get_valid_value(corrected_academic_info.get("minor"), minor)
-
-            # Validate Awarded Date
-            original_awarded_date = get_valid_value(degree.get("awarded_date"))
-            corrected_awarded_date = validate_awarded_date_openai(original_awarded_date) or {}
-            corrected_degree["awarded_date"] = get_valid_value(corrected_awarded_date.get("awarded_date"), original_awarded_date)
-
-            # Validate Overall Credits Earned & Overall GPA
-            overall_credits_earned = get_valid_value(degree.get("overall_credits_earned"), is_numeric=True)
-            overall_gpa = get_valid_value(degree.get("overall_gpa"), is_numeric=True)
-            corrected_performance = validate_academic_performance_openai(overall_credits_earned, overall_gpa) or {}
-
-            corrected_degree["overall_credits_earned"] = get_valid_value(corrected_performance.get("overall_credits_earned"), overall_credits_earned, is_numeric=True)
-            corrected_degree["overall_gpa"] = get_valid_value(corrected_performance.get("overall_gpa"), overall_gpa, is_numeric=True)
-
-            # Validate Coursework (Course Name, Credits Earned, Grade)
-            corrected_courses = []
-
-            for course in degree.get("courses", []):
-                course_name = get_valid_value(course.get("course_name"))
-                credits_earned = get_valid_value(course.get("credits_earned"), is_numeric=True)
-                grade = get_valid_value(course.get("grade"))
-                corrected_course = validate_coursework_openai(course_name, credits_earned, grade) or {}
-
-                corrected_courses.append({
-                    "course_name": get_valid_value(corrected_course.get("course_name"), course_name),
-                    "credits_earned": get_valid_value(corrected_course.get("credits_earned"), credits_earned, is_numeric=True),
-                    "grade": get_valid_value(corrected_course.get("grade"), grade)
+        # The validation requests are independent, so send them concurrently to overlap network latency
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            # Validate Name Fields
+            first_name = get_valid_value(data_dict.get("student", {}).get("first_name"))
+            middle_name = get_valid_value(data_dict.get("student", {}).get("middle_name"))
+            last_name = get_valid_value(data_dict.get("student", {}).get("last_name"))
+            names_future = executor.submit(validate_name_openai, first_name, middle_name, last_name)
+
+            # Submit validation requests for every degree
+            degree_requests = []
+            for degree in data_dict.get("degrees", []):
+                # Academic Information (Institution, Degree, Major, Minor)
+                institution_name = get_valid_value(degree.get("institution_name"))
+                degree_name = get_valid_value(degree.get("degree"))
+                major = get_valid_value(degree.get("major"))
+                minor = get_valid_value(degree.get("minor"))
+
+                # Awarded Date
+                original_awarded_date = get_valid_value(degree.get("awarded_date"))
+
+                # Overall Credits Earned & Overall GPA
+                overall_credits_earned = get_valid_value(degree.get("overall_credits_earned"), is_numeric=True)
+                overall_gpa = get_valid_value(degree.get("overall_gpa"), is_numeric=True)
+
+                # Coursework (Course Name, Credits Earned, Grade), batched into a few requests per degree
+                original_courses = [
+                    {
+                        "course_name": get_valid_value(course.get("course_name")),
+                        "credits_earned": get_valid_value(course.get("credits_earned"), is_numeric=True),
+                        "grade": get_valid_value(course.get("grade"))
+                    }
+                    for course in degree.get("courses", [])
+                ]
+
+                degree_requests.append({
+                    "institution_name": institution_name,
+                    "degree": degree_name,
+                    "major": major,
+                    "minor": minor,
+                    "awarded_date": original_awarded_date,
+                    "overall_credits_earned": overall_credits_earned,
+                    "overall_gpa": overall_gpa,
+                    "courses": original_courses,
+                    "academic_info_future": executor.submit(validate_academic_info_openai, institution_name, degree_name, major, minor),
+                    "awarded_date_future": executor.submit(validate_awarded_date_openai, original_awarded_date),
+                    "performance_future": executor.submit(validate_academic_performance_openai, overall_credits_earned, overall_gpa),
+                    "courses_futures": [
+                        executor.submit(validate_courses_openai, original_courses[start:start + COURSES_PER_VALIDATION_REQUEST])
+                        for start in range(0, len(original_courses), COURSES_PER_VALIDATION_REQUEST)
+                    ]
                 })
 
-            corrected_degree["courses"] = corrected_courses
-            corrected_data["degrees"].append(corrected_degree)
+            # Apply name corrections
+            corrected_names = names_future.result() or {}
+            corrected_data["student"]["first_name"] = get_valid_value(corrected_names.get("first_name"), first_name)
+            corrected_data["student"]["middle_name"] = get_valid_value(corrected_names.get("middle_name"), middle_name)
+            corrected_data["student"]["last_name"] = get_valid_value(corrected_names.get("last_name"), last_name)
+
+            # Apply degree corrections in the original order
+            for request in degree_requests:
+                corrected_degree = {}
+
+                corrected_academic_info = request["academic_info_future"].result() or {}
+                corrected_degree["institution_name"] = get_valid_value(corrected_academic_info.get("institution_name"), request["institution_name"])
+                corrected_degree["degree"] = get_valid_value(corrected_academic_info.get("degree"), request["degree"])
+                corrected_degree["major"] = get_valid_value(corrected_academic_info.get("major"), request["major"])
+                corrected_degree["minor"] = get_valid_value(corrected_academic_info.get("minor"), request["minor"])
+
+                corrected_awarded_date = request["awarded_date_future"].result() or {}
+                corrected_degree["awarded_date"] = get_valid_value(corrected_awarded_date.get("awarded_date"), request["awarded_date"])
+
+                corrected_performance = request["performance_future"].result() or {}
+                corrected_degree["overall_credits_earned"] = get_valid_value(corrected_performance.get("overall_credits_earned"), request["overall_credits_earned"], is_numeric=True)
+                corrected_degree["overall_gpa"] = get_valid_value(corrected_performance.get("overall_gpa"), request["overall_gpa"], is_numeric=True)
+
+                corrected_courses = []
+                course_corrections = [correction for future in request["courses_futures"] for correction in future.result()]
+                for course, corrected_course in zip(request["courses"], course_corrections):
+                    corrected_courses.append({
+                        "course_name": get_valid_value(corrected_course.get("course_name"), course["course_name"]),
+                        "credits_earned": get_valid_value(corrected_course.get("credits_earned"), course["credits_earned"], is_numeric=True),
+                        "grade": get_valid_value(corrected_course.get("grade"), course["grade"])
+                    })
+
+                corrected_degree["courses"] = corrected_courses
+                corrected_data["degrees"].append(corrected_degree)
 
         # Preserve file_name if it exists
         corrected_data["file_name"] = get_valid_value(data_dict.get("file_name", ""))
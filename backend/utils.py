@@ -1,15 +1,19 @@
 import pandas as pd
+import numpy as np
 import os
 from typing import Dict, List, Optional, Any
 import json
+import orjson
 from pydantic import BaseModel
 import base64
 import hashlib
 import traceback
+from functools import lru_cache
 
 
 # Constants for uploading file limits
 ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".csv"}
+ALLOWED_SUFFIXES = tuple(ALLOWED_EXTENSIONS)  # For a single str.endswith check
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB in bytes
 MAX_FILES = 100
 
@@ -69,7 +73,8 @@ class UserDecision(BaseModel):
     decisions: List[FlaggedDegree]
 
 
-# Load course categories from JSON file
+# Load course categories from JSON file (cached, the file does not change while the app is running)
+@lru_cache(maxsize=None)
 def load_course_categories(categories_file = "./course_categories.json"):
     # Check if the categories file exists
     if not os.path.exists(categories_file):
@@ -102,7 +107,7 @@ def decode_file_name(encoded_name: str) -> str:
 # Function to check if the file extension is allowed
 def is_allowed_file(file):
     # Check if the file has an allowed extension
-    if not ("." in file.filename and os.path.splitext(file.filename)[-1].lower() in ALLOWED_EXTENSIONS):
+    if not file.filename.lower().endswith(ALLOWED_SUFFIXES):
         return False
 
     # Check if the file size is within the limit
@@ -195,8 +200,8 @@ def load_json_log(log_file):
                 content = f.read().strip()  
                 if not content: 
                     return {}  # Return an empty dictionary instead of throwing an error
-                return json.loads(content) 
-        except (json.JSONDecodeError, ValueError) as e:  
+                return orjson.loads(content) 
+        except orjson.JSONDecodeError as e:  # Subclass of ValueError
             print(f"⚠️ Warning: JSON log file is corrupted. Resetting log. Error: {str(e)}")
             return {}  # If JSON is invalid, return an empty dictionary
     return {}  # If file does not exist, return an empty dictionary
@@ -204,8 +209,8 @@ def load_json_log(log_file):
 
 # Function to save JSON log file
 def save_json_log(log_file, log_data):
-    with open(log_file, "w", encoding="utf-8") as f:
-        json.dump(log_data, f, indent=4)
+    with open(log_file, "wb") as f:
+        f.write(orjson.dumps(log_data, option=orjson.OPT_INDENT_2))
 
 
 # Function for error handling
@@ -243,41 +248,43 @@ def generate_summary_df(
     unique_categories = list(categories_dict.keys())
     unique_categories.append("Uncategorized")
 
-    # Initialize dictionary to store course details for each category
-    category_mapping = {category: [] for category in unique_categories}
-
-    # Populate category_mapping with course details
-    for _, row in df.iterrows():
-        # Determine formatted course string based on criteria_dict["educator_first_name"] & criteria_dict["educator_last_name"]
-        """if criteria_dict.get("educator_first_name") and criteria_dict.get("educator_last_name"): 
-            formatted_course = f"{row['Course Name']} ({row['Degree']} - {row['Adjusted Credits Earned']} credits)"
-        else:  # Include educator name
-            formatted_course = f"{format_name(row['Educator First Name'], row['Educator Middle Name'], row['Educator Last Name'])}: {row['Course Name']} ({row['Degree']} - {row['Adjusted Credits Earned']} credits)"
-        """
-        formatted_course = f"{row['Course Name']} ({row['Degree']} - {row['Adjusted Credits Earned']} credits - {format_name(row['Educator First Name'], row['Educator Middle Name'], row['Educator Last Name'])})"
-        
-        # Assign course to correct category or "Uncategorized"
-        category = row["Course Category"] if row["Course Category"] in unique_categories else "Uncategorized"
-        category_mapping[category].append(formatted_course)
-
-    # Convert category_mapping to a list of tuples, ensuring every category exists
-    expanded_rows = []
-    for category in unique_categories:
-        if category_mapping[category]:  # If there are courses in this category
-            for course_detail in sorted(set(category_mapping[category])):  # Sort and remove duplicates
-                expanded_rows.append((category, course_detail))
-        else:
-            expanded_rows.append((category, "N/A"))  # If no courses found, assign "N/A"
-
-    # Convert to DataFrame and drop duplicates
-    summary_df = pd.DataFrame(expanded_rows, columns=["Category", "Course Details"]).drop_duplicates()
-
-    # Sort the DataFrame
-    summary_df_sorted = summary_df.sort_values(
-        by=["Category", "Course Details"],
-        key=lambda col: col.str.lower() if col.name in ["Category", "Course Details"] else col,
-        ascending=[True, True]
-    ).reset_index(drop=True)
+    # Assign each course to its category, or "Uncategorized" if the category is unknown (hashed set lookup)
+    category_set = frozenset(unique_categories)
+    course_category = df["Course Category"].where(df["Course Category"].isin(category_set), "Uncategorized")
+
+    # Build the educator names column-wise (same output as format_name: the middle name only if not blank)
+    middle_names = df["Educator Middle Name"]
+    has_middle_name = middle_names.notna() & middle_names.fillna("").astype(str).str.strip().ne("")
+    educator_names = (
+        df["Educator First Name"].astype(str) + " "
+        + pd.Series(np.where(has_middle_name, middle_names.fillna("").astype(str) + " ", ""), index=df.index)
+        + df["Educator Last Name"].astype(str)
+    )
+
+    # Build the formatted course strings column-wise
+    formatted_courses = (
+        df["Course Name"].astype(str) + " (" + df["Degree"].fillna("None").astype(str) + " - " 
+        + df["Adjusted Credits Earned"].astype(str) + " credits - " + educator_names + ")"
+    )
+
+    # Convert to DataFrame and drop duplicates (the final sort orders the course details)
+    summary_df = pd.DataFrame({"Category": course_category, "Course Details": formatted_courses}).drop_duplicates()
+
+    # Ensure every category exists, assigning "N/A" if it has no courses
+    empty_categories = sorted(category_set.difference(summary_df["Category"]))
+    summary_df = pd.concat(
+        [summary_df, pd.DataFrame({"Category": empty_categories, "Course Details": "N/A"})], 
+        ignore_index=True
+    )
+
+    # Sort the DataFrame case-insensitively by category, then course details (the exact text breaks ties)
+    course_details_text = summary_df["Course Details"].to_numpy(dtype=str)
+    sort_order = np.lexsort((
+        course_details_text,
+        np.char.lower(course_details_text),
+        np.char.lower(summary_df["Category"].to_numpy(dtype=str))
+    ))
+    summary_df_sorted = summary_df.iloc[sort_order].reset_index(drop=True)
 
 
     return summary_df_sorted
@@ -14,7 +14,7 @@ call backend\venv\Scripts\activate
 :: --- Start Backend Server ---
 echo Starting FastAPI backend...
 cd backend 
-start /b uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+start /b uvicorn main:app --host 0.0.0.0 --port 8000 --reload --http httptools --ws websockets --ws-per-message-deflate true --ws-ping-interval 20 --ws-ping-timeout 20
 timeout /t 6 >nul
 cd ..
 
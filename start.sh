@@ -17,7 +17,7 @@ if lsof -i :8000 >/dev/null 2>&1; then
   echo "⚠️ Stopping existing backend server..."
   kill -9 $(lsof -t -i :8000)
 fi
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload & 
+uvicorn main:app --host 0.0.0.0 --port 8000 --reload --loop uvloop --http httptools --ws websockets --ws-per-message-deflate true --ws-ping-interval 20 --ws-ping-timeout 20 & 
 sleep 6
 
 # --- Start Frontend Server --- 